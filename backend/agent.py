@@ -1,29 +1,85 @@
-from typing import TypedDict, List, Literal
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
+import asyncio
+import logging
+import threading
+from typing import TypedDict, List, Literal, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from groq import APIConnectionError, InternalServerError, RateLimitError
+from tenacity import retry, retry_if_exception_type, wait_random_exponential, stop_after_attempt
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, AIMessageChunk
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool
 import os
-from config import GROQ_API_KEY
+from config import GROQ_API_KEY, CLASSIFIER_MODEL, ANSWER_MODEL, GROQ_MAX_CONCURRENCY, COMBINED_ROUTING
 from langchain_groq import ChatGroq
 from vectorstore import get_retriever
 from config import TAVILY_API_KEY
 from langchain_tavily import TavilySearch
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
-from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langchain_core.runnables import RunnableConfig
 from persistence import DB_PATH
 
+logger = logging.getLogger(__name__)
+
+
+# Pool for the sync HuggingFace embedder / Pinecone query, kept off the event loop
+_EXEC = ThreadPoolExecutor(max_workers=8)
+
+# In-flight speculative RAG lookups keyed by thread_id, stored with the query they were started for.
+# Tasks are not serializable, so they live here instead of in the checkpointed state.
+_SPECULATIVE_RAG: Dict[str, Tuple[str, asyncio.Task]] = {}
+
+
+def _thread_id(config: RunnableConfig) -> str:
+    return (config or {}).get("configurable", {}).get("thread_id", "")
+
+
+def _discard_speculative_rag(thread_id: str):
+    entry = _SPECULATIVE_RAG.pop(thread_id, None)
+    if entry:
+        entry[1].cancel()
+
+
+def _start_speculative_rag(thread_id: str, query: str):
+    # A newer turn on the same thread supersedes any lookup still pending
+    _discard_speculative_rag(thread_id)
+    _SPECULATIVE_RAG[thread_id] = (query, asyncio.create_task(rag_search_tool.ainvoke(query)))
+
+
+def _take_speculative_rag(thread_id: str, query: str) -> Optional[asyncio.Task]:
+    """Pop the pending lookup for this thread, only if it was started for this query"""
+    entry = _SPECULATIVE_RAG.pop(thread_id, None)
+    if not entry:
+        return None
+    started_for, task = entry
+    if started_for != query:
+        task.cancel()
+        return None
+    return task
+
 
 # Tools
 os.environ["TAVILY_API_KEY"] = TAVILY_API_KEY
 tavily = TavilySearch(max_results=3)
 
+# Identical web queries within 5 minutes reuse the previous Tavily results
+_web_cache = TTLCache(maxsize=1024, ttl=300)
+_WEB_CACHE_LOCK = threading.Lock()
+
 @tool
-def web_search_tool(query: str) -> str:
+async def web_search_tool(query: str) -> str:
     """Uptodate web info via Tavily"""
+    cache_key = query.strip().lower()
+    with _WEB_CACHE_LOCK:
+        cached = _web_cache.get(cache_key)
+    if cached is not None:
+        logger.debug("Web search served from cache")
+        return cached
+
     try:
-        result = tavily.invoke({"query": query})
+        result = await tavily.ainvoke({"query": query})
         if isinstance(result, dict) and 'results' in result:
             formatted_results = []
             for item in result['results']:
@@ -31,22 +87,32 @@ def web_search_tool(query: str) -> str:
                 content = item.get('content', 'No content')
                 url = item.get('url', '')
                 formatted_results.append(f"Title: {title}\n Content: {content}\nURL:{url}")
-            return "\n\n".join(formatted_results) if formatted_results else "No results found"
+            snippets = "\n\n".join(formatted_results) if formatted_results else "No results found"
         else:
-            return str(result)
+            snippets = str(result)
             
     except Exception as e:
         return f"WEB_Error::{e}"
 
+    # Errors are not cached so the next call retries Tavily
+    with _WEB_CACHE_LOCK:
+        _web_cache[cache_key] = snippets
+    return snippets
+
+
+
 
+def _retrieve(query: str):
+    retriever_instance = get_retriever()
+    return retriever_instance.invoke(query, k=3)
 
 
 @tool
-def rag_search_tool(query: str) -> str:
+async def rag_search_tool(query: str) -> str:
     """Top-k chunks from the knowledge Base"""
     try:
-        retriever_instance = get_retriever()
-        docs = retriever_instance.invoke(query, k=3)
+        loop = asyncio.get_running_loop()
+        docs = await loop.run_in_executor(_EXEC, _retrieve, query)
         return "\n\n".join(d.page_content for d in docs) if docs else ""
     
     except Exception as e:
@@ -54,6 +120,21 @@ def rag_search_tool(query: str) -> str:
 
 
 
+# Tools bound to the combined node's LLM. Only the tool name is used to pick the
+# next node; the lookup itself runs in rag_node / web_node on the user's query.
+@tool
+async def retrieve_kb(query: str) -> str:
+    """Search the internal knowledge base of uploaded documents. Use for specific entities, product details, procedures, policies or facts likely covered by those documents."""
+    return await rag_search_tool.ainvoke(query)
+
+
+@tool
+async def web_search(query: str) -> str:
+    """Search the web. Use only for current events, live data or very recent news."""
+    return await web_search_tool.ainvoke(query)
+
+
+
 #Pydentic Schemas for structured outpt
 class RouteDecision(BaseModel):
     route: Literal['rag', 'web', 'answer', 'end']
@@ -65,19 +146,80 @@ class RagJudge(BaseModel):
 
 
 # LLM Instances with structured schemas
+# max_retries=0: the SDK would retry 429s while holding a _GROQ_SEM slot; _groq_retry backs off outside it
 os.environ["GROQ_API_KEY"] = GROQ_API_KEY
 
 router_llm = ChatGroq(
-    model = "llama-3.3-70b-versatile", 
-    temperature = 0).with_structured_output(RouteDecision)
+    model = CLASSIFIER_MODEL, 
+    temperature = 0,
+    max_retries = 0).with_structured_output(RouteDecision)
 
 judge_llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    temperature=0).with_structured_output(RagJudge)
+    model=CLASSIFIER_MODEL,
+    temperature=0,
+    max_retries=0).with_structured_output(RagJudge)
 
 answer_llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    temperature=0)
+    model=ANSWER_MODEL,
+    temperature=0,
+    max_retries=0)
+
+# Single-call fast path: answers directly or asks for a lookup via a tool call
+combined_llm = answer_llm.bind_tools([retrieve_kb, web_search])
+combined_llm_no_web = answer_llm.bind_tools([retrieve_kb])
+
+
+# Caps in-flight Groq requests across all sessions so bursts don't trip 429s
+_GROQ_SEM = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+
+# Covers what the SDK's own retries used to: rate limits, dropped connections and 5xx
+_groq_retry = retry(
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, InternalServerError)),
+    wait=wait_random_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+
+
+@_groq_retry
+async def _groq(llm, messages):
+    async with _GROQ_SEM:
+        return await llm.ainvoke(messages)
+
+
+@_groq_retry
+async def _open_stream(llm, messages):
+    """Acquire a Groq slot, start the stream and read its first chunk.
+    Only this part is retried: once tokens have gone out a retry would replay them."""
+    await _GROQ_SEM.acquire()
+    stream = None
+    try:
+        stream = llm.astream(messages).__aiter__()
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except BaseException:
+        if stream is not None:
+            await stream.aclose()
+        _GROQ_SEM.release()
+        raise
+    return stream, first
+
+
+async def _groq_stream(llm, messages) -> AIMessageChunk:
+    """Stream a Groq call and return the aggregated message, tool calls included"""
+    # Tokens still reach LangGraph's "messages" stream through the callbacks
+    stream, first = await _open_stream(llm, messages)
+    try:
+        if first is None:
+            return AIMessageChunk(content="")
+        message = first
+        async for chunk in stream:
+            message += chunk
+        return message
+    finally:
+        await stream.aclose()
+        _GROQ_SEM.release()
 
 
 
@@ -85,65 +227,144 @@ answer_llm = ChatGroq(
 #State : Shared Data Structure
 class AgentState(TypedDict, total = False):
     messages: List[BaseMessage]
+    # Latest user message, set once by the caller so nodes don't rescan messages
+    last_query: str
     route: Literal['rag', 'web', 'answer', 'end']
     rag: str
     web: str
     web_search_enabled: bool
+    # Set by rag_node when the chunks were too short to send to the judge
+    judge_skipped: bool
 
 
 # Node: For Individual functions
+# --- Node 0: combined (route + answer in one call) ---
+
+COMBINED_SYSTEM_PROMPT = (
+    "You are a helpful assistant backed by an internal knowledge base of uploaded documents. "
+    "If you can answer accurately from general knowledge, or the message is a greeting or small talk, reply directly. "
+    "If the answer likely depends on the uploaded documents (specific entities, product details, procedures, policies), "
+    "call the retrieve_kb tool instead of answering."
+)
+COMBINED_WEB_PROMPT = (
+    " If the question needs current events, live data or very recent news, call the web_search tool."
+)
+
+
+async def combined_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    logger.debug("Entering combined_node")
+    query = state["last_query"]
+    web_search_enabled = state.get("web_search_enabled", True)
+
+    # Start retrieval speculatively so it overlaps with the combined call
+    thread_id = _thread_id(config)
+    _start_speculative_rag(thread_id, query)
+
+    if web_search_enabled:
+        llm, system_prompt = combined_llm, COMBINED_SYSTEM_PROMPT + COMBINED_WEB_PROMPT
+    else:
+        llm, system_prompt = combined_llm_no_web, COMBINED_SYSTEM_PROMPT
+
+    # Streamed so a direct answer reaches the client token by token
+    try:
+        response = await _groq_stream(llm, [("system", system_prompt), ("user", query)])
+    except Exception:
+        _discard_speculative_rag(thread_id)
+        raise
+
+    tool_names = [call["name"] for call in response.tool_calls]
+    if "retrieve_kb" in tool_names:
+        route = "rag"
+    elif "web_search" in tool_names and web_search_enabled:
+        route = "web"
+    else:
+        route = "end"
+    logger.debug("Combined node decision: %s, tool calls: %s", route, tool_names)
+
+    if route != "rag":
+        _discard_speculative_rag(thread_id)
+
+    # Reset context left in the checkpoint by the previous turn
+    out = {
+        "messages": state["messages"],
+        "route": route,
+        "rag": "",
+        "web": "",
+        "web_search_enabled": web_search_enabled
+    }
+    if route == "end":
+        out["messages"] = state["messages"] + [AIMessage(content=response.content)]
+
+    return out
+
+
 # --- Node 1: router (decision) ---
 
-def router_node(state: AgentState) -> AgentState:
-    print("\n--- Entering router_node ---")
-    query = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
+# Router system prompts are built once per web search setting: no per-call string
+# concatenation, and the identical prefix on every call lets Groq's prompt cache hit
+_ROUTER_PROMPT_BASE = (
+    "You are an intelligent routing agent designed to direct user queries to the most appropriate tool."
+    "Your primary goal is to provide accurate and relevant information by selecting the best source."
+    "Prioritize using the **internal knowledge base (RAG)** for factual information that is likely "
+    "to be contained within pre-uploaded documents or for common, well-established facts."
+)
+
+_ROUTER_PROMPT_ROUTES_WEB_ON = (
+    "You **CAN** use web search for queries that require very current, real-time, or broad general knowledge "
+    "that is unlikely to be in a specific, static knowledge base (e.g., today's news, live data, very recent events)."
+    "\n\nChoose one of the following routes:"
+    "\n- 'rag': For queries about specific entities, historical facts, product details, procedures, or any information that would typically be found in a curated document collection (e.g., 'What is X?', 'How does Y work?', 'Explain Z policy')."
+    "\n- 'web': For queries about current events, live data, very recent news, or broad general knowledge that requires up-to-date internet access (e.g., 'Who won the election yesterday?', 'What is the weather in London?', 'Latest news on technology')."
+)
+
+_ROUTER_PROMPT_ROUTES_WEB_OFF = (
+    "**Web search is currently DISABLED.** You **MUST NOT** choose the 'web' route."
+    "If a query would normally require web search, you should attempt to answer it using RAG (if applicable) or directly from your general knowledge."
+    "\n\nChoose one of the following routes:"
+    "\n- 'rag': For queries about specific entities, historical facts, product details, procedures, or any information that would typically be found in a curated document collection, AND for queries that would normally go to web search but web search is disabled."
+    "\n- 'answer': For very simple, direct questions you can answer without any external lookup (e.g., 'What is your name?')."
+)
+
+_ROUTER_PROMPT_TAIL = (
+    "\n- 'answer': For very simple, direct questions you can answer without any external lookup (e.g., 'What is your name?')."
+    "\n- 'end': For pure greetings or small-talk where no factual answer is expected (e.g., 'Hi', 'How are you?'). If choosing 'end', you MUST provide a 'reply'."
+    "\n\nExample routing decisions:"
+    "\n- User: 'What are the treatment of diabetes?' -> Route: 'rag' (Factual knowledge, likely in KB)."
+    "\n- User: 'What is the capital of France?' -> Route: 'rag' (Common knowledge, can be in KB or answered directly if LLM knows)."
+    "\n- User: 'Who won the NBA finals last night?' -> Route: 'web' (Current event, requires live data)."
+    "\n- User: 'How do I submit an expense report?' -> Route: 'rag' (Internal procedure)."
+    "\n- User: 'Tell me about quantum computing.' -> Route: 'rag' (Foundational knowledge can be in KB. If KB is sparse, judge will route to web if enabled)."
+    "\n- User: 'Hello there!' -> Route: 'end', reply='Hello! How can I assist you today?'"
+)
+
+_SYS_PROMPT_WEB_ON = _ROUTER_PROMPT_BASE + _ROUTER_PROMPT_ROUTES_WEB_ON + _ROUTER_PROMPT_TAIL
+_SYS_PROMPT_WEB_OFF = _ROUTER_PROMPT_BASE + _ROUTER_PROMPT_ROUTES_WEB_OFF + _ROUTER_PROMPT_TAIL
+
+
+async def router_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    logger.debug("Entering router_node")
+    query = state["last_query"]
+
+    # Start retrieval speculatively so it overlaps with the router call
+    thread_id = _thread_id(config)
+    _start_speculative_rag(thread_id, query)
     
     # Get web_search_enabled from state
     web_search_enabled = state.get("web_search_enabled", True)
-    print(f"Router received web search info : {web_search_enabled}")
+    logger.debug("Router received web search info: %s", web_search_enabled)
  
-    system_prompt = (
-        "You are an intelligent routing agent designed to direct user queries to the most appropriate tool."
-        "Your primary goal is to provide accurate and relevant information by selecting the best source."
-        "Prioritize using the **internal knowledge base (RAG)** for factual information that is likely "
-        "to be contained within pre-uploaded documents or for common, well-established facts."
-    )
-    
-    if web_search_enabled:
-        system_prompt += (
-            "You **CAN** use web search for queries that require very current, real-time, or broad general knowledge "
-            "that is unlikely to be in a specific, static knowledge base (e.g., today's news, live data, very recent events)."
-            "\n\nChoose one of the following routes:"
-            "\n- 'rag': For queries about specific entities, historical facts, product details, procedures, or any information that would typically be found in a curated document collection (e.g., 'What is X?', 'How does Y work?', 'Explain Z policy')."
-            "\n- 'web': For queries about current events, live data, very recent news, or broad general knowledge that requires up-to-date internet access (e.g., 'Who won the election yesterday?', 'What is the weather in London?', 'Latest news on technology')."
-        )
-    else:
-        system_prompt += (
-            "**Web search is currently DISABLED.** You **MUST NOT** choose the 'web' route."
-            "If a query would normally require web search, you should attempt to answer it using RAG (if applicable) or directly from your general knowledge."
-            "\n\nChoose one of the following routes:"
-            "\n- 'rag': For queries about specific entities, historical facts, product details, procedures, or any information that would typically be found in a curated document collection, AND for queries that would normally go to web search but web search is disabled."
-            "\n- 'answer': For very simple, direct questions you can answer without any external lookup (e.g., 'What is your name?')."
-        )
-
-    system_prompt += (
-        "\n- 'answer': For very simple, direct questions you can answer without any external lookup (e.g., 'What is your name?')."
-        "\n- 'end': For pure greetings or small-talk where no factual answer is expected (e.g., 'Hi', 'How are you?'). If choosing 'end', you MUST provide a 'reply'."
-        "\n\nExample routing decisions:"
-        "\n- User: 'What are the treatment of diabetes?' -> Route: 'rag' (Factual knowledge, likely in KB)."
-        "\n- User: 'What is the capital of France?' -> Route: 'rag' (Common knowledge, can be in KB or answered directly if LLM knows)."
-        "\n- User: 'Who won the NBA finals last night?' -> Route: 'web' (Current event, requires live data)."
-        "\n- User: 'How do I submit an expense report?' -> Route: 'rag' (Internal procedure)."
-        "\n- User: 'Tell me about quantum computing.' -> Route: 'rag' (Foundational knowledge can be in KB. If KB is sparse, judge will route to web if enabled)."
-        "\n- User: 'Hello there!' -> Route: 'end', reply='Hello! How can I assist you today?'"
-    )
+    system_prompt = _SYS_PROMPT_WEB_ON if web_search_enabled else _SYS_PROMPT_WEB_OFF
 
     messages = [
         ("system", system_prompt),
         ("user", query)
     ]
 
-    result: RouteDecision = router_llm.invoke(messages)
+    try:
+        result: RouteDecision = await _groq(router_llm, messages)
+    except Exception:
+        _discard_speculative_rag(thread_id)
+        raise
 
     initial_route_decision = result.route
     route_override_reason = None
@@ -152,9 +373,13 @@ def router_node(state: AgentState) -> AgentState:
     if not web_search_enabled and result.route == "web":
         result.route = "rag"
         route_override_reason = "web search disabled by user."
-        print(f"Router decision overriden: changed from web to rag")
+        logger.debug("Router decision overridden: changed from web to rag")
 
-    print(f"Route final decision: {result.route}, reply (if 'end'): {result.reply}")
+    logger.debug("Route final decision: %s, reply (if 'end'): %s", result.route, result.reply)
+
+    # The speculative chunks are only consumed on the rag route
+    if result.route != "rag":
+        _discard_speculative_rag(thread_id)
 
     out = {
         "messages" : state['messages'],
@@ -170,8 +395,6 @@ def router_node(state: AgentState) -> AgentState:
     if result.route == "end":
         out["messages"] = state["messages"] + [AIMessage(content=result.reply)]
 
-    
-    print("Existing router node")
     return out
 
 
@@ -180,63 +403,86 @@ def router_node(state: AgentState) -> AgentState:
 
 # Node 2 : Rag
 
-def rag_node(state: AgentState) -> AgentState:
-    print("Entering the rag node.")
-    query = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)),"")
+# Retrieved text shorter than this skips the judge call
+MIN_RAG_CHARS = 50
+
+_JUDGE_SYSTEM_PROMPT = (
+    "You are a judge evaluating if the **retrieved information** is **sufficient and relevant** "
+    "to fully and accurately answer the user's question. "
+    "Consider if the retrieved text directly addresses the question's core and provides enough detail. "
+    "If the information is incomplete, vague, outdated, or doesn't directly answer the question, it's NOT sufficient. "
+    "If it provides a clear, direct, and comprehensive answer, it IS sufficient. "
+    "If no relevant information was retrieved at all (e.g., 'No results found'), it is definitely NOT sufficient.\n\n"
+    "Examples:\n"
+    "- Question: 'What is the capital of France?' Retrieved: 'Paris is the capital of France.' -> sufficient: true\n"
+    "- Question: 'What are the symptoms of diabetes?' Retrieved: 'Diabetes is a chronic condition.' -> sufficient: false (Doesn't answer symptoms)\n"
+    "- Question: 'How to fix error X in software Y?' Retrieved: 'No relevant information found.' -> sufficient: false"
+)
+
+_JUDGE_USER_TEMPLATE = "Question: {query} \n\n Retrieved info: {chunks} \n\nIs this sufficient to answer the question?"
+
+
+async def rag_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    logger.debug("Entering rag_node")
+    query = state["last_query"]
     web_search_enabled = state.get("web_search_enabled", True)
-    print(f"Route received web search info:{web_search_enabled}")
-    print(f"RAG Query:{query}")
+    logger.debug("RAG received web search info: %s", web_search_enabled)
+    logger.debug("RAG query: %s", query)
 
 
-    chunks = rag_search_tool.invoke(query)
+    # Reuse the retrieval started by the router when there is one
+    speculative = _take_speculative_rag(_thread_id(config), query)
+    chunks = await speculative if speculative else await rag_search_tool.ainvoke(query)
 
     # Logic to handel tje chunks
     if chunks.startswith("RAG_Error::"):
-        print(f"RAG Error:{chunks}, checking web search enabled status")
+        logger.warning("RAG error: %s, checking web search enabled status", chunks)
 
         # if rag fails, and web search is enabled
         next_route = "web" if web_search_enabled else "answer"
-        return {**state, "rag":"", "route": next_route}
+        return {**state, "rag":"", "route": next_route, "judge_skipped": False}
     
     if chunks:
-        print(f"Retrived RAG chunks : {chunks[:500]}...")
+        logger.debug("Retrieved RAG chunks: %.500s...", chunks)
     else:
-        print(f"No RAG Chunk Retrived")
+        logger.debug("No RAG chunks retrieved")
+
+    # Nothing substantive to judge, the verdict would be 'not sufficient' anyway
+    if len(chunks.strip()) < MIN_RAG_CHARS:
+        next_route = "web" if web_search_enabled else "answer"
+        logger.debug("RAG chunks too short to judge, next route: %s", next_route)
+        return {
+            **state,
+            "rag" : chunks,
+            "route": next_route,
+            "web_search_enabled": web_search_enabled,
+            # Tells the trace the judge never ran, "answer" here doesn't mean sufficient
+            "judge_skipped": True
+        }
     
     judge_messages = [
-        ("system", (
-            "You are a judge evaluating if the **retrieved information** is **sufficient and relevant** "
-            "to fully and accurately answer the user's question. "
-            "Consider if the retrieved text directly addresses the question's core and provides enough detail. "
-            "If the information is incomplete, vague, outdated, or doesn't directly answer the question, it's NOT sufficient. "
-            "If it provides a clear, direct, and comprehensive answer, it IS sufficient. "
-            "If no relevant information was retrieved at all (e.g., 'No results found'), it is definitely NOT sufficient.\n\n"
-            "Examples:\n"
-            "- Question: 'What is the capital of France?' Retrieved: 'Paris is the capital of France.' -> sufficient: true\n"
-            "- Question: 'What are the symptoms of diabetes?' Retrieved: 'Diabetes is a chronic condition.' -> sufficient: false (Doesn't answer symptoms)\n"
-            "- Question: 'How to fix error X in software Y?' Retrieved: 'No relevant information found.' -> sufficient: false"
-        )),
-        ("user", f"Question: {query} \n\n Retrieved info: {chunks} \n\nIs this sufficient to answer the question?")
+        ("system", _JUDGE_SYSTEM_PROMPT),
+        ("user", _JUDGE_USER_TEMPLATE.format(query=query, chunks=chunks))
         ]
     
-    RegJudge = judge_llm.invoke(judge_messages)
+    RegJudge = await _groq(judge_llm, judge_messages)
     verdict = RegJudge
 
-    print(f"Rag Judge verdict: {verdict.sufficient}")
-    print("Existing rag_node")
+    logger.debug("RAG judge verdict: %s", verdict.sufficient)
 
     # Decide the next route based on sufficiency and web_search info
     if verdict.sufficient:
         next_route = "answer"
     else:
         next_route = "web" if web_search_enabled else "answer"
-        print(f"Rag not sufficient. Web search enabled :{web_search_enabled}. next route: {next_route}")
+        logger.debug("RAG not sufficient. Web search enabled: %s, next route: %s", web_search_enabled, next_route)
 
     return {
         **state,
         "rag" : chunks,
         "route": next_route,
-        "web_search_enabled": web_search_enabled
+        "web_search_enabled": web_search_enabled,
+        "judge_skipped": False
     }    
 
 
@@ -246,32 +492,40 @@ def rag_node(state: AgentState) -> AgentState:
 
 #Node 3: Web Search
 
-def web_node(state: AgentState )-> AgentState:
-    print("\n--- Entering web_node ---")
-    query = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
+async def web_node(state: AgentState )-> AgentState:
+    logger.debug("Entering web_node")
+    query = state["last_query"]
     web_search_enabled = state.get("web_search_enabled", True)
     if not web_search_enabled:
-        print("web search node entered but search is disabled")
+        logger.debug("web_node entered but web search is disabled")
         return {**state, "web":"web search was disabled by user", "route" : "answer"}
 
-    print (f"web search query:{query}")
-    snippets = web_search_tool.invoke(query)
+    logger.debug("Web search query: %s", query)
+    snippets = await web_search_tool.ainvoke(query)
 
 
     if snippets.startswith("WEB_Error"):
-        print(f"web error: {snippets}. predicting answer with limited info")
+        logger.warning("Web search error: %s, answering with limited info", snippets)
         return{**state, "web":"","route":"answer"}
     
-    print(f"web snippets retrieved: {snippets[:200]}")
-    print("Exiting web_node")
+    logger.debug("Web snippets retrieved: %.200s", snippets)
     return{**state, "web":snippets, "route":"answer"}
 
 
 # Node 4: Finally Answer
 
-def answer_node (state: AgentState) -> AgentState:
-    print("\n--- Entering answer_node ---")
-    user_query = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
+# Static scaffolding built once, without the indentation the old inline f-string shipped to the LLM
+_ANSWER_TEMPLATE = (
+    "Please answer the user's question using the provided context.\n"
+    "If the context is empty or irrelevant, rely on general knowledge.\n\n"
+    "Question: {q}\n"
+    "Context: {ctx}\n\n"
+    "Provide a helpful, accurate, concise response."
+)
+
+async def answer_node (state: AgentState) -> AgentState:
+    logger.debug("Entering answer_node")
+    user_query = state["last_query"]
 
 
     ctx_parts = []
@@ -287,20 +541,11 @@ def answer_node (state: AgentState) -> AgentState:
         context = "No external context is availabled for this query. Try to answer based on general knowledge."
 
 
-    prompt = f"""
-                Please answer the user's question using the provided context.
-                If the context is empty or irrelavant, try to answer based on you general knowledge.
-            
-
-                Question: {user_query}    
-                context: {context}
-
-                Provide a helpful, accurate, and concise response based on the available information.
-            """
-    print (f"prompt sent to answer_llm: {prompt[:500]}...")
-    ans = answer_llm.invoke([HumanMessage(content=prompt)]).content
-    print(f"Final answer: {ans[:200]}...")
-    print("Exiting answer node")
+    prompt = _ANSWER_TEMPLATE.format(q=user_query, ctx=context)
+    logger.debug("Prompt sent to answer_llm: %.500s...", prompt)
+    # Stream so LangGraph's "messages" mode can forward tokens as they arrive
+    ans = (await _groq_stream(answer_llm, [HumanMessage(content=prompt)])).content
+    logger.debug("Final answer: %.200s...", ans)
     
 
     return{
@@ -312,6 +557,12 @@ def answer_node (state: AgentState) -> AgentState:
 
 
 # --- Routing helpers ---
+def select_entry(_) -> Literal["combined", "router"]:
+    return "combined" if COMBINED_ROUTING else "router"
+
+def from_combined(st: AgentState) -> Literal["rag", "web", "end"]:
+    return st["route"]
+
 def from_router(st: AgentState) -> Literal["rag", "web", "answer", "end"]:
     return st["route"]
 
@@ -323,15 +574,33 @@ def after_web(_) -> Literal["answer"]:
 
 
 # --- Build graph ---
-def build_agent():
-    """Builds and compiles the LangGraph agent."""
+async def build_agent():
+    """Builds and compiles the LangGraph agent. Must be awaited inside the running event loop."""
     graph = StateGraph(AgentState)
+    graph.add_node("combined", combined_node)
     graph.add_node("router", router_node)
     graph.add_node("rag_lookup", rag_node)
     graph.add_node("web_search", web_node)
     graph.add_node("answer", answer_node)
 
-    graph.set_entry_point("router")
+    # Fast path answers in one Groq call; the router path is kept for comparison
+    graph.set_conditional_entry_point(
+        select_entry,
+        {
+            "combined": "combined",
+            "router": "router"
+        }
+    )
+
+    graph.add_conditional_edges(
+        "combined",
+        from_combined,
+        {
+            "rag": "rag_lookup",
+            "web": "web_search",
+            "end": END
+        }
+    )
     
     graph.add_conditional_edges(
         "router",
@@ -359,20 +628,17 @@ def build_agent():
     # Use SQLite persistence for reliable checkpointing
     # IMPORTANT: Use a separate database file to avoid conflicts with backend/persistence.py
     # which creates its own checkpoints table with a different schema
-    import sqlite3
+    import aiosqlite
     from pathlib import Path
     langgraph_db_path = Path(__file__).parent / "data" / "langgraph_checkpoints.db"
     langgraph_db_path.parent.mkdir(parents=True, exist_ok=True)
     
-    conn = sqlite3.connect(str(langgraph_db_path), check_same_thread=False)
-    checkpointer = SqliteSaver(conn)
+    conn = await aiosqlite.connect(str(langgraph_db_path))
+    checkpointer = AsyncSqliteSaver(conn)
     
     # Setup the database schema (creates tables if they don't exist)
-    checkpointer.setup()
+    await checkpointer.setup()
 
     # Compile graph with SQLite storage
     agent = graph.compile(checkpointer=checkpointer)
-    print(agent)
     return agent
-
-rag_agent = build_agent()
@@ -14,6 +14,16 @@ PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME","rag-index")
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# Small model for the one-field router/judge outputs, large model for answers
+CLASSIFIER_MODEL = os.getenv("CLASSIFIER_MODEL", "llama-3.1-8b-instant")
+ANSWER_MODEL = os.getenv("ANSWER_MODEL", "llama-3.3-70b-versatile")
+
+# Maximum concurrent Groq requests across all sessions
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+
+# Route and answer in a single Groq call; set to false to use the router -> judge -> answer path
+COMBINED_ROUTING = os.getenv("COMBINED_ROUTING", "true").lower() == "true"
+
 # Tavily
 
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
@@ -24,4 +34,11 @@ EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 
 # Path (Adjust as needed)
 
-DOC_SOURCE_DIR = os.getenv("DOC_SOURCE_DIR", "data")
\ No newline at end of file
+DOC_SOURCE_DIR = os.getenv("DOC_SOURCE_DIR", "data")
+
+# Semantic answer cache
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+# Shorter queries ("why?", "tell me more") lean on the conversation, so they are never cached
+SEMANTIC_CACHE_MIN_WORDS = int(os.getenv("SEMANTIC_CACHE_MIN_WORDS", "4"))
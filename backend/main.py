@@ -1,31 +1,70 @@
 # rag_agent_app/backend/main.py
 
 import os
+import json
+import asyncio
 import time
+import traceback
 from typing import List, Dict, Any
 import tempfile
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, status, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 
 
-from agent import rag_agent
+from agent import build_agent
 from vectorstore import add_document, clear_index
+import semantic_cache
 from persistence import (
     save_document_metadata, get_all_documents, delete_document,
     clear_all_documents, get_session_stats
 )
 
+# Compiled LangGraph agent, built on startup since its async checkpointer needs the running loop
+rag_agent = None
+
+# Fire-and-forget work started by requests; holding the tasks keeps them from being garbage collected
+_background_tasks = set()
+
+
+def _in_background(func, *args):
+    """Run a blocking call in the threadpool without making the response wait for it"""
+    task = asyncio.create_task(run_in_threadpool(func, *args))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _sweep_semantic_cache():
+    """Drop expired semantic cache entries on a timer instead of inside a user's request"""
+    while True:
+        await run_in_threadpool(semantic_cache.sweep_expired)
+        await asyncio.sleep(semantic_cache.SWEEP_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global rag_agent
+    rag_agent = await build_agent()
+    sweeper = asyncio.create_task(_sweep_semantic_cache())
+    yield
+    sweeper.cancel()
+    await rag_agent.checkpointer.conn.close()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="LangGraph RAG Agent API",
     description="API for the LangGraph-powered RAG agent with Pinecone and Groq.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # In-memory session manager for LangGraph checkpoints (for demonstration)
@@ -79,8 +118,10 @@ async def clear_knowledge_base():
     Useful for starting fresh or removing stale data.
     """
     try:
-        clear_index()
-        clear_all_documents()  # Clear document metadata
+        # Blocking Pinecone/SQLite calls run in the threadpool so open chat streams keep flowing
+        await run_in_threadpool(clear_index)
+        await run_in_threadpool(clear_all_documents)  # Clear document metadata
+        await run_in_threadpool(semantic_cache.clear)  # Cached answers may cite the removed documents
         return {"status": "success", "message": "Knowledge base cleared successfully"}
     except Exception as e:
         raise HTTPException(
@@ -109,14 +150,17 @@ async def upload_document(file: UploadFile = File(...)):
 
     try:
         loader = PyPDFLoader(temp_file_path)
-        documents = loader.load()
+        documents = await run_in_threadpool(loader.load)
 
         total_chunks_added = 0
         if documents:
             full_text_content = "\n\n".join([doc.page_content for doc in documents])
-            total_chunks_added = add_document(full_text_content)
+            # Embedding and upserting the whole PDF blocks, keep it off the event loop
+            total_chunks_added = await run_in_threadpool(add_document, full_text_content)
             # Save document metadata for persistence
-            save_document_metadata(file.filename, total_chunks_added)
+            await run_in_threadpool(save_document_metadata, file.filename, total_chunks_added)
+            # Cached answers were produced without this document
+            await run_in_threadpool(semantic_cache.clear)
         
         return DocumentUploadResponse(
             message=f"PDF '{file.filename}' successfully uploaded and indexed.",
@@ -137,126 +181,230 @@ async def upload_document(file: UploadFile = File(...)):
 
 
 # --- Chat Endpoint ---
+def _trace_event(step: int, current_node_name: str, node_output_state: Dict[str, Any]) -> TraceEvent:
+    """Describe one graph node update for the frontend trace viewer"""
+    event_description = f"Executing node: {current_node_name}"
+    event_details = {}
+    event_type = "generic_node_execution"
+
+    if current_node_name == "combined":
+        route_decision = node_output_state.get('route')
+        if route_decision == "end":
+            event_description = "Answered directly in a single LLM call."
+        else:
+            event_description = f"Single LLM call requested a lookup: '{route_decision}'"
+        event_details = {"decision": route_decision}
+        event_type = "router_decision"
+
+    elif current_node_name == "router":
+        route_decision = node_output_state.get('route')
+        # Check for overridden route if web search was disabled
+        initial_decision = node_output_state.get('initial_router_decision', route_decision)
+        override_reason = node_output_state.get('router_override_reason', None)
+
+        if override_reason:
+            event_description = f"Router initially decided: '{initial_decision}'. Overridden to: '{route_decision}' because {override_reason}."
+            event_details = {"initial_decision": initial_decision, "final_decision": route_decision, "override_reason": override_reason}
+        else:
+            event_description = f"Router decided: '{route_decision}'"
+            event_details = {"decision": route_decision, "reason": "Based on initial query analysis."}                
+        event_type = "router_decision"
+
+
+    elif current_node_name == "rag_lookup":
+        rag_content_summary = node_output_state.get("rag", "")[:200] + "..."
+        
+        rag_sufficient = node_output_state.get("route") == "answer" 
+        
+        if node_output_state.get("judge_skipped"):
+            next_step = "Proceeding to answer without it (web search disabled)." if rag_sufficient else "Diverting to web search."
+            event_description = f"RAG Lookup performed. Too little content retrieved to judge. {next_step}"
+            event_details = {"retrieved_content_summary": rag_content_summary, "sufficiency_verdict": "Skipped (too little content)"}
+        elif rag_sufficient:
+            event_description = f"RAG Lookup performed. Content found and deemed sufficient. Proceeding to answer."
+            event_details = {"retrieved_content_summary": rag_content_summary, "sufficiency_verdict": "Sufficient"}
+        else:
+            event_description = f"RAG Lookup performed. Content NOT sufficient. Diverting to web search."
+            event_details = {"retrieved_content_summary": rag_content_summary, "sufficiency_verdict": "Not Sufficient"}
+        
+        event_type = "rag_action"
+
+
+    elif current_node_name == "web_search":
+        web_content_summary = node_output_state.get("web", "")[:200] + "..."
+        event_description = f"Web Search performed. Results retrieved. Proceeding to answer."
+        event_details = {"retrieved_content_summary": web_content_summary}
+        event_type = "web_action"
+
+
+    elif current_node_name == "answer":
+        event_description = "Generating final answer using gathered context."
+        event_type = "answer_generation"
+
+
+    elif current_node_name == "__end__":
+        event_description = "Agent process completed."
+        event_type = "process_end"
+
+    return TraceEvent(
+        step=step,
+        node_name=current_node_name,
+        description=event_description,
+        details=event_details,
+        event_type=event_type
+    )
+
+
+async def _run_agent(request: QueryRequest):
+    """
+    Run one chat turn.
+    Yields ("token", str) as the answer is generated, ("trace", TraceEvent) per node,
+    and finally ("done", str) with the full answer.
+    """
+    # Serve near-identical questions straight from the semantic cache
+    cached_answer = await run_in_threadpool(
+        semantic_cache.lookup, request.query, request.enable_web_search
+    )
+    if cached_answer:
+        yield "trace", TraceEvent(
+            step=1,
+            node_name="semantic_cache",
+            description="Answer served from the semantic cache.",
+            event_type="cache_hit"
+        )
+        yield "token", cached_answer
+        yield "done", cached_answer
+        return
+
+    # Pass enable_web_search into the config for the agent to access
+    config = {
+        "configurable": {
+            "thread_id": request.session_id,
+            "web_search_enabled": request.enable_web_search
+        }
+    }
+    inputs = {"messages": [HumanMessage(content=request.query)], "last_query": request.query}
+
+    final_message = ""
+    
+    print(f"--- Starting Agent Stream for session {request.session_id} ---")
+    print(f"Web Search Enabled: {request.enable_web_search}") # For server-side debugging
+
+    step = 0
+    s = None
+    tokens_streamed = False
+    combined_tool_call = False
+    used_web = False
+    async for mode, payload in rag_agent.astream(inputs, config=config, stream_mode=["updates", "messages"]):
+        if mode == "messages":
+            # Only the answer and combined nodes' tokens are user-facing, router/judge emit structured output.
+            # A node's final AIMessage is emitted here too once it returns; it repeats the whole answer.
+            chunk, metadata = payload
+            node = metadata.get("langgraph_node")
+            if node not in ("answer", "combined") or not isinstance(chunk, AIMessageChunk):
+                continue
+            # A combined call that asks for a lookup isn't the answer; the answer node will stream it
+            if node == "combined":
+                combined_tool_call = combined_tool_call or bool(chunk.tool_call_chunks)
+                if combined_tool_call:
+                    continue
+            if chunk.content:
+                tokens_streamed = True
+                yield "token", chunk.content
+            continue
+
+        s = payload
+        step += 1
+        if '__end__' in s:
+            current_node_name = '__end__'
+            node_output_state = s['__end__']
+        else:
+            current_node_name = list(s.keys())[0] 
+            node_output_state = s[current_node_name]
+        if current_node_name == "web_search":
+            used_web = True
+
+        event = _trace_event(step, current_node_name, node_output_state)
+        print(f"Streamed Event: Step {step} - Node: {current_node_name} - Desc: {event.description}")
+        yield "trace", event
+
+    # Get the final state from the last yielded update in the stream
+    final_actual_state_dict = None
+    if s:
+        if '__end__' in s:
+            final_actual_state_dict = s['__end__']
+        else:
+            if list(s.keys()):
+                final_actual_state_dict = s[list(s.keys())[0]]
+
+    if final_actual_state_dict and "messages" in final_actual_state_dict:
+        for msg in reversed(final_actual_state_dict["messages"]):
+            if isinstance(msg, AIMessage):
+                final_message = msg.content
+                break
+    
+    if not final_message:
+         print("Agent finished, but no final AIMessage found in the final state after stream completion.")
+         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Agent did not return a valid response (final AI message not found).")
+
+    print(f"--- Agent Stream Ended. Final Response: {final_message[:200]}... ---")
+
+    # Replies that skip the answer node (e.g. greetings) arrive in one piece
+    if not tokens_streamed:
+        yield "token", final_message
+
+    # Web answers go stale within minutes (like the Tavily cache), far sooner than the cache TTL.
+    # The embed + upsert happens after the response, the client shouldn't wait on it.
+    if not used_web:
+        _in_background(semantic_cache.store, request.query, final_message, request.enable_web_search)
+
+    yield "done", final_message
+
+
 @app.post("/chat/", response_model=AgentResponse)
 async def chat_with_agent(request: QueryRequest):
     trace_events_for_frontend: List[TraceEvent] = []
+    final_message = ""
     
     try:
-        # Pass enable_web_search into the config for the agent to access
-        config = {
-            "configurable": {
-                "thread_id": request.session_id,
-                "web_search_enabled": request.enable_web_search
-            }
-        }
-        inputs = {"messages": [HumanMessage(content=request.query)]}
-
-        final_message = ""
-        
-        print(f"--- Starting Agent Stream for session {request.session_id} ---")
-        print(f"Web Search Enabled: {request.enable_web_search}") # For server-side debugging
-
-        for i, s in enumerate(rag_agent.stream(inputs, config=config)):
-            current_node_name = None
-            node_output_state = None
-
-            if '__end__' in s:
-                current_node_name = '__end__'
-                node_output_state = s['__end__']
-            else:
-                current_node_name = list(s.keys())[0] 
-                node_output_state = s[current_node_name]
-
-            event_description = f"Executing node: {current_node_name}"
-            event_details = {}
-            event_type = "generic_node_execution"
-
-            if current_node_name == "router":
-                route_decision = node_output_state.get('route')
-                # Check for overridden route if web search was disabled
-                initial_decision = node_output_state.get('initial_router_decision', route_decision)
-                override_reason = node_output_state.get('router_override_reason', None)
-
-                if override_reason:
-                    event_description = f"Router initially decided: '{initial_decision}'. Overridden to: '{route_decision}' because {override_reason}."
-                    event_details = {"initial_decision": initial_decision, "final_decision": route_decision, "override_reason": override_reason}
-                else:
-                    event_description = f"Router decided: '{route_decision}'"
-                    event_details = {"decision": route_decision, "reason": "Based on initial query analysis."}                
-                event_type = "router_decision"
-
-
-            elif current_node_name == "rag_lookup":
-                rag_content_summary = node_output_state.get("rag", "")[:200] + "..."
-                
-                rag_sufficient = node_output_state.get("route") == "answer" 
-                
-                if rag_sufficient:
-                    event_description = f"RAG Lookup performed. Content found and deemed sufficient. Proceeding to answer."
-                    event_details = {"retrieved_content_summary": rag_content_summary, "sufficiency_verdict": "Sufficient"}
-                else:
-                    event_description = f"RAG Lookup performed. Content NOT sufficient. Diverting to web search."
-                    event_details = {"retrieved_content_summary": rag_content_summary, "sufficiency_verdict": "Not Sufficient"}
-                
-                event_type = "rag_action"
-
-
-            elif current_node_name == "web_search":
-                web_content_summary = node_output_state.get("web", "")[:200] + "..."
-                event_description = f"Web Search performed. Results retrieved. Proceeding to answer."
-                event_details = {"retrieved_content_summary": web_content_summary}
-                event_type = "web_action"
-
-
-            elif current_node_name == "answer":
-                event_description = "Generating final answer using gathered context."
-                event_type = "answer_generation"
-
-
-            elif current_node_name == "__end__":
-                event_description = "Agent process completed."
-                event_type = "process_end"
-
-            trace_events_for_frontend.append(
-                TraceEvent(
-                    step=i + 1,
-                    node_name=current_node_name,
-                    description=event_description,
-                    details=event_details,
-                    event_type=event_type
-                )
-            )
-            print(f"Streamed Event: Step {i+1} - Node: {current_node_name} - Desc: {event_description}")
-
-        # Get the final state from the last yielded item in the stream
-        final_actual_state_dict = None
-        if s:
-            if '__end__' in s:
-                final_actual_state_dict = s['__end__']
-            else:
-                if list(s.keys()):
-                    final_actual_state_dict = s[list(s.keys())[0]]
-
-        if final_actual_state_dict and "messages" in final_actual_state_dict:
-            for msg in reversed(final_actual_state_dict["messages"]):
-                if isinstance(msg, AIMessage):
-                    final_message = msg.content
-                    break
-        
-        if not final_message:
-             print("Agent finished, but no final AIMessage found in the final state after stream completion.")
-             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Agent did not return a valid response (final AI message not found).")
-
-        print(f"--- Agent Stream Ended. Final Response: {final_message[:200]}... ---")
+        async for kind, value in _run_agent(request):
+            if kind == "trace":
+                trace_events_for_frontend.append(value)
+            elif kind == "done":
+                final_message = value
 
         return AgentResponse(response=final_message, trace_events=trace_events_for_frontend)
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         error_details = f"Error during agent invocation: {e}"
         print(error_details)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal Server Error: {e}")
+
+
+@app.post("/chat/stream")
+async def chat_with_agent_stream(request: QueryRequest):
+    """
+    Streams the answer as newline-delimited JSON:
+    {"type": "token", "content": ...} while generating, {"type": "trace", "event": {...}} per node,
+    then {"type": "done", "response": ...} or {"type": "error", "detail": ...}
+    """
+    async def event_stream():
+        try:
+            async for kind, value in _run_agent(request):
+                if kind == "token":
+                    payload = {"type": "token", "content": value}
+                elif kind == "trace":
+                    payload = {"type": "trace", "event": value.model_dump()}
+                else:
+                    payload = {"type": "done", "response": value}
+                yield json.dumps(payload) + "\n"
+        except Exception as e:
+            traceback.print_exc()
+            print(f"Error during agent invocation: {e}")
+            yield json.dumps({"type": "error", "detail": f"Internal Server Error: {e}"}) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
     
 
 @app.get("/health")
@@ -0,0 +1,67 @@
+"""
+ONNX Runtime embedder
+Exports the sentence-transformers model to ONNX once, quantizes it to int8
+and serves embed_query / embed_documents from the quantized graph
+"""
+
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+
+from query_embedding_cache import cached_embed_query
+
+# Exported + quantized models are cached here so the export only happens once
+ONNX_DIR = Path(__file__).parent / "data" / "onnx"
+QUANTIZED_FILE_NAME = "model_quantized.onnx"
+
+
+class OnnxEmbeddings(Embeddings):
+    """Int8-quantized ONNX version of a sentence-transformers model (mean pooling + L2 norm)"""
+
+    def __init__(self, model_name: str, batch_size: int = 32, max_length: int = 256):
+        model_dir = ONNX_DIR / model_name.replace("/", "__")
+        if not (model_dir / QUANTIZED_FILE_NAME).exists():
+            print(f"Exporting {model_name} to ONNX and quantizing to int8...")
+            model = ORTModelForFeatureExtraction.from_pretrained(
+                model_name, export=True, provider="CPUExecutionProvider"
+            )
+            quantizer = ORTQuantizer.from_pretrained(model)
+            qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=model_dir, quantization_config=qconfig)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name=QUANTIZED_FILE_NAME, provider="CPUExecutionProvider"
+        )
+        self.batch_size = batch_size
+        # Matches the sentence-transformers max_seq_length for MiniLM
+        self.max_length = max_length
+        self._embed_query_cached = cached_embed_query(
+            lambda text: self._encode([text])[0].tolist(), self.tokenizer
+        )
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        token_embeddings = self.model(**inputs).last_hidden_state
+
+        # Mean pooling over real tokens, then normalize like the sentence-transformers pipeline
+        mask = inputs["attention_mask"][..., None].astype(token_embeddings.dtype)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self._encode(texts[i:i + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_query_cached(text)
@@ -4,8 +4,9 @@ Uses SQLite for reliable, persistent checkpoint storage
 """
 
 import sqlite3
-import json
+import orjson
 import os
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any
@@ -23,11 +24,19 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 DB_PATH = DATA_DIR / "checkpoints.db"
 
+# One shared autocommit connection in WAL mode instead of a connect/close per call
+_CONN = sqlite3.connect(str(DB_PATH), check_same_thread=False, isolation_level=None)
+_CONN.execute("PRAGMA journal_mode=WAL")
+_CONN.execute("PRAGMA synchronous=NORMAL")
+_CONN.execute("PRAGMA temp_store=MEMORY")
+
+# SQLite allows a single writer at a time
+_WRITE_LOCK = threading.Lock()
+
 
 def init_checkpoint_db():
     """Initialize the checkpoint database"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
+    cursor = _CONN.cursor()
     
     # Create checkpoints table if it doesn't exist
     cursor.execute("""
@@ -61,39 +70,41 @@ def init_checkpoint_db():
             embedding_id TEXT
         )
     """)
-    
-    conn.commit()
-    conn.close()
+
+    # Covers load_chat_history's thread_id filter and created_at ordering.
+    # documents.filename needs no extra index, its UNIQUE constraint already creates one.
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_thread_time
+        ON chat_history(thread_id, created_at)
+    """)
+
+    cursor.close()
 
 
 def save_checkpoint(thread_id: str, checkpoint_data: Dict[str, Any]):
     """Save checkpoint data for a session"""
-    init_checkpoint_db()
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
+    cursor = _CONN.cursor()
     
     try:
-        checkpoint_json = json.dumps(checkpoint_data)
+        checkpoint_json = orjson.dumps(checkpoint_data).decode()
         
         # Insert or replace checkpoint
-        cursor.execute("""
-            INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_data, updated_at)
-            VALUES (?, ?, CURRENT_TIMESTAMP)
-        """, (thread_id, checkpoint_json))
+        with _WRITE_LOCK:
+            cursor.execute("""
+                INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_data, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            """, (thread_id, checkpoint_json))
         
-        conn.commit()
         print(f" Checkpoint saved for thread {thread_id}")
     except Exception as e:
         print(f" Error saving checkpoint: {e}")
     finally:
-        conn.close()
+        cursor.close()
 
 
 def load_checkpoint(thread_id: str) -> Optional[Dict[str, Any]]:
     """Load checkpoint data for a session"""
-    init_checkpoint_db()
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
+    cursor = _CONN.cursor()
     
     try:
         cursor.execute("""
@@ -102,39 +113,34 @@ def load_checkpoint(thread_id: str) -> Optional[Dict[str, Any]]:
         
         result = cursor.fetchone()
         if result:
-            return json.loads(result[0])
+            return orjson.loads(result[0])
         return None
     except Exception as e:
         print(f" Error loading checkpoint: {e}")
         return None
     finally:
-        conn.close()
+        cursor.close()
 
 
 def save_chat_message(thread_id: str, role: str, content: str):
     """Save a chat message to the database"""
-    init_checkpoint_db()
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
+    cursor = _CONN.cursor()
     
     try:
-        cursor.execute("""
-            INSERT INTO chat_history (thread_id, message_role, message_content)
-            VALUES (?, ?, ?)
-        """, (thread_id, role, content))
-        
-        conn.commit()
+        with _WRITE_LOCK:
+            cursor.execute("""
+                INSERT INTO chat_history (thread_id, message_role, message_content)
+                VALUES (?, ?, ?)
+            """, (thread_id, role, content))
     except Exception as e:
         print(f" Error saving chat message: {e}")
     finally:
-        conn.close()
+        cursor.close()
 
 
 def load_chat_history(thread_id: str) -> list:
     """Load all chat messages for a session"""
-    init_checkpoint_db()
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
+    cursor = _CONN.cursor()
     
     try:
         cursor.execute("""
@@ -155,34 +161,30 @@ def load_chat_history(thread_id: str) -> list:
         print(f" Error loading chat history: {e}")
         return []
     finally:
-        conn.close()
+        cursor.close()
 
 
 def save_document_metadata(filename: str, chunks_count: int, embedding_id: Optional[str] = None):
     """Save document metadata"""
-    init_checkpoint_db()
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
+    cursor = _CONN.cursor()
     
     try:
-        cursor.execute("""
-            INSERT OR REPLACE INTO documents (filename, chunks_count, embedding_id)
-            VALUES (?, ?, ?)
-        """, (filename, chunks_count, embedding_id))
+        with _WRITE_LOCK:
+            cursor.execute("""
+                INSERT OR REPLACE INTO documents (filename, chunks_count, embedding_id)
+                VALUES (?, ?, ?)
+            """, (filename, chunks_count, embedding_id))
         
-        conn.commit()
         print(f" Document metadata saved for {filename}")
     except Exception as e:
         print(f" Error saving document metadata: {e}")
     finally:
-        conn.close()
+        cursor.close()
 
 
 def get_all_documents() -> list:
     """Get all uploaded documents"""
-    init_checkpoint_db()
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
+    cursor = _CONN.cursor()
     
     try:
         cursor.execute("""
@@ -202,49 +204,43 @@ def get_all_documents() -> list:
         print(f" Error loading documents: {e}")
         return []
     finally:
-        conn.close()
+        cursor.close()
 
 
 def delete_document(filename: str):
     """Delete document metadata"""
-    init_checkpoint_db()
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
+    cursor = _CONN.cursor()
     
     try:
-        cursor.execute("""
-            DELETE FROM documents WHERE filename = ?
-        """, (filename,))
+        with _WRITE_LOCK:
+            cursor.execute("""
+                DELETE FROM documents WHERE filename = ?
+            """, (filename,))
         
-        conn.commit()
         print(f" Document metadata deleted for {filename}")
     except Exception as e:
         print(f" Error deleting document metadata: {e}")
     finally:
-        conn.close()
+        cursor.close()
 
 
 def clear_all_documents():
     """Clear all document metadata"""
-    init_checkpoint_db()
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
+    cursor = _CONN.cursor()
     
     try:
-        cursor.execute("DELETE FROM documents")
-        conn.commit()
+        with _WRITE_LOCK:
+            cursor.execute("DELETE FROM documents")
         print(" All document metadata cleared")
     except Exception as e:
         print(f" Error clearing documents: {e}")
     finally:
-        conn.close()
+        cursor.close()
 
 
 def get_session_stats() -> Dict[str, Any]:
     """Get statistics about stored sessions"""
-    init_checkpoint_db()
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
+    cursor = _CONN.cursor()
     
     try:
         # Count sessions
@@ -273,7 +269,7 @@ def get_session_stats() -> Dict[str, Any]:
         print(f" Error getting session stats: {e}")
         return {}
     finally:
-        conn.close()
+        cursor.close()
 
 
 # Initialize database on module import
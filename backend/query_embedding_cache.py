@@ -0,0 +1,23 @@
+"""
+Query embedding cache
+Memoizes embed_query on normalized text, shared by the ONNX and PyTorch embedders
+"""
+
+from functools import lru_cache
+from typing import Callable, List
+
+
+def cached_embed_query(embed: Callable[[str], List[float]], tokenizer, maxsize: int = 4096) -> Callable[[str], List[float]]:
+    """
+    Wrap embed so repeated queries skip the model.
+    Whitespace is always collapsed; case is only folded when the tokenizer lowercases anyway,
+    otherwise a cased model would embed queries differently from the documents.
+    """
+    lowercase = getattr(tokenizer, "do_lower_case", False)
+    cached = lru_cache(maxsize=maxsize)(lambda text: tuple(embed(text)))
+
+    def embed_query(text: str) -> List[float]:
+        text = " ".join(text.split())
+        return list(cached(text.lower() if lowercase else text))
+
+    return embed_query
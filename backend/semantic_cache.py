@@ -0,0 +1,108 @@
+"""
+Semantic answer cache
+Stores (query embedding -> final answer) pairs in a dedicated Pinecone namespace
+so near-identical questions can skip the agent graph entirely
+"""
+
+import threading
+import time
+import uuid
+from typing import Optional
+
+from config import SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_MIN_WORDS
+from vectorstore import _INDEX, embeddings
+
+CACHE_NAMESPACE = "answer-cache"
+
+# Expired entries are swept from the namespace this often, by a timer in main.py
+SWEEP_INTERVAL = 3600
+_SWEEP_LOCK = threading.Lock()
+
+
+def cacheable(query: str) -> bool:
+    """Short follow-ups depend on the conversation, so another session's answer would be wrong"""
+    return len(query.split()) >= SEMANTIC_CACHE_MIN_WORDS
+
+
+def lookup(query: str, web_search_enabled: bool = True) -> Optional[str]:
+    """Return a cached answer whose query is similar enough to this one, if any"""
+    if not cacheable(query):
+        return None
+    try:
+        result = _INDEX.query(
+            vector=embeddings.embed_query(query),
+            top_k=1,
+            namespace=CACHE_NAMESPACE,
+            include_metadata=True,
+            filter={
+                "created_at": {"$gte": time.time() - SEMANTIC_CACHE_TTL},
+                "web_search_enabled": {"$eq": web_search_enabled},
+            },
+        )
+        if result.matches and result.matches[0].score >= SEMANTIC_CACHE_THRESHOLD:
+            print(f"Semantic cache hit (score {result.matches[0].score:.3f})")
+            return result.matches[0].metadata["answer"]
+        return None
+    except Exception as e:
+        print(f"Error looking up semantic cache: {e}")
+        return None
+
+
+def store(query: str, answer: str, web_search_enabled: bool = True):
+    """Cache the final answer for a query"""
+    if not cacheable(query):
+        return
+    try:
+        created_at = time.time()
+        _INDEX.upsert(
+            vectors=[{
+                # Creation time leads the id so expired entries can be found by listing ids
+                "id": f"{int(created_at)}#{uuid.uuid4()}",
+                "values": embeddings.embed_query(query),
+                "metadata": {
+                    "query": query,
+                    "answer": answer,
+                    "web_search_enabled": web_search_enabled,
+                    "created_at": created_at,
+                },
+            }],
+            namespace=CACHE_NAMESPACE,
+        )
+    except Exception as e:
+        print(f"Error storing semantic cache entry: {e}")
+
+
+def sweep_expired():
+    """Delete entries older than the TTL; lookups only filter them out"""
+    # A sweep still listing the namespace makes an overlapping one redundant
+    if not _SWEEP_LOCK.acquire(blocking=False):
+        return
+    try:
+        # Serverless indexes can't delete by metadata filter, so go by the timestamp in the id
+        cutoff = time.time() - SEMANTIC_CACHE_TTL
+        for ids in _INDEX.list(namespace=CACHE_NAMESPACE):
+            stale = [i for i in ids if _created_at(i) < cutoff]
+            if stale:
+                _INDEX.delete(ids=stale, namespace=CACHE_NAMESPACE)
+                print(f"Removed {len(stale)} expired semantic cache entries")
+    except Exception as e:
+        print(f"Error sweeping semantic cache: {e}")
+    finally:
+        _SWEEP_LOCK.release()
+
+
+def _created_at(vector_id: str) -> float:
+    try:
+        return float(vector_id.split("#", 1)[0])
+    except ValueError:
+        # Entries written before ids carried a timestamp
+        return 0.0
+
+
+def clear():
+    """Drop every cached answer, e.g. after the knowledge base changes"""
+    try:
+        _INDEX.delete(delete_all=True, namespace=CACHE_NAMESPACE)
+        print("Semantic cache cleared")
+    except Exception as e:
+        print(f"Error clearing semantic cache: {e}")
@@ -1,33 +1,57 @@
 import os
-from pinecone import Pinecone, ServerlessSpec
+import uuid
+from typing import List, Any
+from pydantic import PrivateAttr
+from pinecone import ServerlessSpec
+from pinecone.grpc import PineconeGRPC as Pinecone
 from langchain_pinecone import PineconeVectorStore
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from config import PINECONE_API_KEY
+from config import PINECONE_API_KEY, EMBED_MODEL
+from query_embedding_cache import cached_embed_query
+
+# The int8 ONNX embedder needs optimum[onnxruntime]; fall back to PyTorch without it
+try:
+    from onnx_embeddings import OnnxEmbeddings
+except ImportError:
+    OnnxEmbeddings = None
 
 # Set environment variable for pinecone
 
 os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
 
-#Initialize pinecone client
+#Initialize pinecone client (gRPC keeps one multiplexed HTTP/2 channel per index)
 pc = Pinecone(api_key= PINECONE_API_KEY)
 
+class CachedHuggingFaceEmbeddings(HuggingFaceEmbeddings):
+    """HuggingFaceEmbeddings that memoizes embed_query so repeated queries skip the model"""
+
+    _embed_query_cached: Any = PrivateAttr(default=None)
+
+    def model_post_init(self, __context):
+        super().model_post_init(__context)
+        self._embed_query_cached = cached_embed_query(super().embed_query, self._client.tokenizer)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_query_cached(text)
+
+
 # Define embedding models
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+if OnnxEmbeddings:
+    embeddings = OnnxEmbeddings(EMBED_MODEL)
+else:
+    print("optimum not installed, using the PyTorch HuggingFace embedder")
+    embeddings = CachedHuggingFaceEmbeddings(model_name=EMBED_MODEL)
 
 INDEX_NAME = "rag-index"
 
-# retriever fuction
-def get_retriever():
-    """We are creating a retriever function that:
-        Retrieves the most semantically matching embeddings from the vector database
-        Creates the Pinecone vector database if it does not already exist
-        And finally serves the retrieved context to the LLM for answer generation
-    """
-    # ensure the index exists, create if not
+# Vectors per Pinecone upsert request
+UPSERT_BATCH_SIZE = 100
+
+
+def _ensure_index():
+    """Create the Pinecone index if it does not already exist"""
     if INDEX_NAME not in pc.list_indexes().names():
         print("Create")
         pc.create_index(
@@ -39,8 +63,22 @@ def get_retriever():
         )
         print("Created Pincone index.")
 
-    vectorstore = PineconeVectorStore(index_name= INDEX_NAME, embedding= embeddings)
-    return vectorstore.as_retriever()
+
+_ensure_index()
+
+# Shared index handle and vector store so every query, upload and delete
+# reuses the same index connection
+_INDEX = pc.Index(INDEX_NAME)
+_VECTORSTORE = PineconeVectorStore(index=_INDEX, embedding=embeddings)
+
+
+# retriever fuction
+def get_retriever():
+    """We are creating a retriever function that:
+        Retrieves the most semantically matching embeddings from the vector database
+        And finally serves the retrieved context to the LLM for answer generation
+    """
+    return _VECTORSTORE.as_retriever(search_kwargs={"k": 3})
 
 #Upload documents to vectorstore
 
@@ -64,11 +102,24 @@ def add_document(text_content:str):
 
     print("Splitting document into chunk for indexing...")
 
-    # get vectorstore instance to add documents
-    vectorstore = PineconeVectorStore(index_name= INDEX_NAME, embedding=embeddings)
-
-    # add documents to vectorstore
-    vectorstore.add_documents(documents)
+    # Embed every chunk in one batched forward pass
+    texts = [doc.page_content for doc in documents]
+    vectors = embeddings.embed_documents(texts)
+
+    # Stored under "text" so PineconeVectorStore can read the chunks back
+    records = [
+        (str(uuid.uuid4()), vector, {**doc.metadata, "text": doc.page_content})
+        for doc, vector in zip(documents, vectors)
+    ]
+
+    # The gRPC client refuses async_req together with batch_size, so send
+    # each batch as its own async request and wait for all of them
+    futures = [
+        _INDEX.upsert(vectors=records[i:i + UPSERT_BATCH_SIZE], async_req=True)
+        for i in range(0, len(records), UPSERT_BATCH_SIZE)
+    ]
+    for future in futures:
+        future.result()
     print(f"Successfully added {len(documents)} chunks to pinecone vector store")
     
     return len(documents)
@@ -79,8 +130,7 @@ def clear_index():
     Delete all vectors from the Pinecone index
     """
     try:
-        index = pc.Index(INDEX_NAME)
-        index.delete(delete_all=True)
+        _INDEX.delete(delete_all=True)
         print(f"Successfully cleared all vectors from index: {INDEX_NAME}")
     except Exception as e:
         print(f"Error clearing index: {e}")
@@ -3,14 +3,17 @@ Persistence layer for Streamlit app
 Handles saving and loading chat history and document metadata
 """
 
-import json
+import orjson
 import os
+import sqlite3
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 PERSISTENCE_DIR = Path.home() / ".rag_chatbot"
 CHAT_HISTORY_FILE = PERSISTENCE_DIR / "chat_history.json"
+CHAT_DB_FILE = PERSISTENCE_DIR / "chat_history.db"
 DOCUMENTS_FILE = PERSISTENCE_DIR / "documents.json"
 
 
@@ -19,41 +22,118 @@ def ensure_persistence_dir():
     PERSISTENCE_DIR.mkdir(parents=True, exist_ok=True)
 
 
+def _init_chat_db() -> sqlite3.Connection:
+    """Open the chat database, mirroring the backend chat_history schema"""
+    ensure_persistence_dir()
+    conn = sqlite3.connect(str(CHAT_DB_FILE), check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            thread_id TEXT NOT NULL,
+            message_role TEXT NOT NULL,
+            message_content TEXT NOT NULL,
+            message_meta TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_thread_time
+        ON chat_history(thread_id, created_at)
+    """)
+    return conn
+
+
+# Streamlit runs each session's script in its own thread, so share one
+# connection and serialize writes
+_CONN = _init_chat_db()
+_WRITE_LOCK = threading.Lock()
+
+
+def save_chat_messages(session_id: str, messages: List[Dict[str, Any]]):
+    """Append messages to a session in a single transaction"""
+    # Anything besides role/content (timestamp, trace_events) is kept as JSON
+    rows = [
+        (
+            session_id,
+            message["role"],
+            message["content"],
+            orjson.dumps({k: v for k, v in message.items() if k not in ("role", "content")}).decode()
+        )
+        for message in messages
+    ]
+    try:
+        with _WRITE_LOCK:
+            _CONN.execute("BEGIN")
+            try:
+                _CONN.executemany("""
+                    INSERT INTO chat_history (thread_id, message_role, message_content, message_meta)
+                    VALUES (?, ?, ?, ?)
+                """, rows)
+                _CONN.execute("COMMIT")
+            except Exception:
+                _CONN.execute("ROLLBACK")
+                raise
+    except Exception as e:
+        print(f"Error saving chat messages: {e}")
+
+
+def append_chat_message(session_id: str, message: Dict[str, Any]):
+    """Append a single new message to a session"""
+    save_chat_messages(session_id, [message])
+
+
 def load_chat_history(session_id: str) -> List[Dict[str, Any]]:
     """Load chat history for a specific session"""
-    ensure_persistence_dir()
-    
-    if not CHAT_HISTORY_FILE.exists():
-        return []
-    
     try:
-        with open(CHAT_HISTORY_FILE, 'r') as f:
-            all_chats = json.load(f)
-            return all_chats.get(session_id, [])
+        rows = _CONN.execute("""
+            SELECT message_role, message_content, message_meta FROM chat_history
+            WHERE thread_id = ?
+            ORDER BY created_at ASC, id ASC
+        """, (session_id,)).fetchall()
+        return [
+            {"role": role, "content": content, **orjson.loads(meta or "{}")}
+            for role, content, meta in rows
+        ]
     except Exception as e:
         print(f"Error loading chat history: {e}")
         return []
 
 
 def save_chat_history(session_id: str, messages: List[Dict[str, Any]]):
-    """Save chat history for a specific session"""
-    ensure_persistence_dir()
-    
+    """
+    Sync a full message list for a session, writing only messages not stored yet.
+    New messages should go through append_chat_message; this is for bulk imports.
+    """
     try:
-        # Load existing data
-        all_chats = {}
-        if CHAT_HISTORY_FILE.exists():
-            with open(CHAT_HISTORY_FILE, 'r') as f:
-                all_chats = json.load(f)
-        
-        # Update with new messages
-        all_chats[session_id] = messages
-        
-        # Save back
-        with open(CHAT_HISTORY_FILE, 'w') as f:
-            json.dump(all_chats, f, indent=2)
+        stored = _CONN.execute(
+            "SELECT COUNT(*) FROM chat_history WHERE thread_id = ?", (session_id,)
+        ).fetchone()[0]
     except Exception as e:
         print(f"Error saving chat history: {e}")
+        return
+    
+    if len(messages) > stored:
+        save_chat_messages(session_id, messages[stored:])
+
+
+def _migrate_json_history():
+    """One-time import of the legacy chat_history.json into SQLite"""
+    if not CHAT_HISTORY_FILE.exists():
+        return
+    
+    try:
+        with open(CHAT_HISTORY_FILE, 'rb') as f:
+            all_chats = orjson.loads(f.read())
+        for session_id, messages in all_chats.items():
+            save_chat_history(session_id, messages)
+        CHAT_HISTORY_FILE.rename(CHAT_HISTORY_FILE.with_suffix(".json.migrated"))
+    except Exception as e:
+        print(f"Error migrating chat history: {e}")
+
+
+_migrate_json_history()
 
 
 def load_documents() -> List[str]:
@@ -64,8 +144,8 @@ def load_documents() -> List[str]:
         return []
     
     try:
-        with open(DOCUMENTS_FILE, 'r') as f:
-            data = json.load(f)
+        with open(DOCUMENTS_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
             return data.get("documents", [])
     except Exception as e:
         print(f"Error loading documents: {e}")
@@ -81,8 +161,8 @@ def save_documents(documents: List[str]):
             "documents": documents,
             "last_updated": datetime.now().isoformat()
         }
-        with open(DOCUMENTS_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        with open(DOCUMENTS_FILE, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
     except Exception as e:
         print(f"Error saving documents: {e}")
 
@@ -110,24 +190,23 @@ def clear_all_documents():
     save_documents([])
 
 
-def get_session_list() -> List[Dict[str, Any]]:
-    """Get list of all sessions with message counts"""
-    ensure_persistence_dir()
-    
-    if not CHAT_HISTORY_FILE.exists():
-        return []
-    
+def get_session_list(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Get the most recent sessions with message counts, at most `limit` of them"""
     try:
-        with open(CHAT_HISTORY_FILE, 'r') as f:
-            all_chats = json.load(f)
-            sessions = []
-            for session_id, messages in all_chats.items():
-                sessions.append({
-                    "session_id": session_id,
-                    "message_count": len(messages),
-                    "last_message_time": messages[-1].get("timestamp", "N/A") if messages else "N/A"
-                })
-            return sorted(sessions, key=lambda x: x["last_message_time"], reverse=True)
+        rows = _CONN.execute("""
+            SELECT thread_id, COUNT(*), MAX(created_at) FROM chat_history
+            GROUP BY thread_id
+            ORDER BY 3 DESC
+            LIMIT ?
+        """, (-1 if limit is None else limit,)).fetchall()
+        return [
+            {
+                "session_id": session_id,
+                "message_count": message_count,
+                "last_message_time": last_time
+            }
+            for session_id, message_count, last_time in rows
+        ]
     except Exception as e:
         print(f"Error getting session list: {e}")
         return []
@@ -1,12 +1,17 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from requests_toolbelt.multipart.encoder import MultipartEncoder
 import json
 from typing import Optional
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 from persistence import (
-    load_chat_history, save_chat_history, load_documents, 
-    save_documents, get_session_list
+    load_chat_history, append_chat_message, load_documents, 
+    save_documents, get_session_list, clear_all_documents
 )
 
 # Page configuration
@@ -17,184 +22,113 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Dark theme styling - FIXING ALIGNMENT AND VISIBILITY ISSUES
-st.markdown("""
-<style>
-    :root {
-        --primary-bg: #1a1a1a;
-        --secondary-bg: #2a2a2a;
-        --tertiary-bg: #353535;
-        --text-primary: #ececec;
-        --text-secondary: #a0a0a0;
-        --accent-green: #10a37f;
-        --border-color: #404040;
-    }
+# Dark theme styling, read from disk once per process.
+# It's still emitted every run: Streamlit drops elements a rerun doesn't re-emit.
+@st.cache_data(show_spinner=False)
+def _css():
+    return (Path(__file__).parent / "style.css").read_text()
 
-    /* Base theme overrides */
-    html, body, .stApp {
-        background-color: var(--primary-bg);
-        color: var(--text-primary);
-    }
-    
-    /* Improve spacing and layout */
-    .block-container {
-        padding-top: 2rem !important;
-        padding-bottom: 2rem !important;
-    }
-
-    /* Sidebar styling */
-    section[data-testid="stSidebar"] {
-        background-color: var(--primary-bg);
-        border-right: 1px solid var(--border-color);
-    }
-
-    /* Common elements text color */
-    h1, h2, h3, h4, h5, h6, p, li, span, div {
-        color: var(--text-primary);
-    }
-
-    /* Buttons - Standardize look */
-    .stButton button {
-        background-color: var(--tertiary-bg);
-        color: var(--text-primary);
-        border: 1px solid var(--border-color);
-        transition: all 0.2s ease;
-    }
-
-    .stButton button:hover {
-        background-color: var(--secondary-bg);
-        border-color: var(--accent-green);
-        color: var(--text-primary);
-    }
+st.markdown(f"<style>{_css()}</style>", unsafe_allow_html=True)
 
-    /* Input fields */
-    .stTextInput input, .stSelectbox select {
-        background-color: var(--secondary-bg);
-        color: var(--text-primary);
-        border: 1px solid var(--border-color);
-    }
-
-    .stTextInput input:focus {
-        border-color: var(--accent-green);
-        box-shadow: 0 0 0 1px var(--accent-green);
-    }
+# Configuration
+import os
+API_BASE_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 
-    /* Chat bubble styling */
-    .user-message {
-        display: flex;
-        justify-content: flex-end;
-        margin: 10px 0;
-    }
+# One pooled keep-alive HTTP session shared across reruns and users
+@st.cache_resource
+def get_http():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.2)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-    .user-bubble {
-        background-color: var(--accent-green);
-        color: white;
-        padding: 10px 15px;
-        border-radius: 15px 15px 0 15px;
-        max-width: 75%;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-    }
+# Separate keep-alive session for the health probe: get_http()'s retries would stretch its 1s timeout past 3s
+@st.cache_resource
+def _probe_http():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-    .assistant-message {
-        display: flex;
-        justify-content: flex-start;
-        margin: 10px 0;
-    }
+# Cheap cached liveness probe so a down backend fails fast instead of waiting out the chat timeout
+@st.cache_data(ttl=5, show_spinner=False)
+def _backend_up(url):
+    try:
+        return _probe_http().get(f"{url}/health", timeout=1).ok
+    except Exception:
+        return False
 
-    .assistant-bubble {
-        background-color: var(--secondary-bg);
-        color: var(--text-primary);
-        padding: 10px 15px;
-        border-radius: 15px 15px 15px 0;
-        max-width: 75%;
-        border: 1px solid var(--border-color);
-        box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-    }
+# Worker threads for slow admin calls (clear, upload) so the script can keep updating their status
+@st.cache_resource
+def _bg_executor():
+    return ThreadPoolExecutor(max_workers=2)
 
-    /* File uploader styling */
-    [data-testid="stFileUploader"] {
-        background-color: var(--secondary-bg);
-        padding: 20px;
-        border-radius: 10px;
-        border: 1px dashed var(--border-color);
-    }
+def _wait_for(fut, status_text, message):
+    """Poll a background request, showing elapsed time, and return its response"""
+    start = time.time()
+    while not fut.done():
+        status_text.text(f"{message} ({time.time() - start:.0f}s)")
+        time.sleep(0.1)
+    return fut.result()
 
-    [data-testid="stFileUploader"] section {
-         background-color: transparent;
-    }
+def _iter_tokens(response, stream_result):
+    """Yield answer tokens from the backend's NDJSON stream, collecting trace events, errors and the final answer"""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        event = json.loads(line)
+        if event["type"] == "token":
+            yield event["content"]
+        elif event["type"] == "trace":
+            stream_result["trace_events"].append(event["event"])
+        elif event["type"] == "done":
+            stream_result["response"] = event["response"]
+        elif event["type"] == "error":
+            stream_result["error"] = event["detail"]
 
-    /* Expander header */
-    .streamlit-expanderHeader {
-        background-color: var(--secondary-bg);
-        color: var(--text-primary);
-        border-radius: 5px;
-    }
+# Cached persistence reads so reruns don't hit storage; cleared explicitly after writes
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_session_list(limit: int = 10):
+    return get_session_list(limit=limit)
 
-    /* Metrics and Cards */
-    [data-testid="stMetricValue"] {
-        color: var(--accent-green);
-    }
-    
-    /* Scrollbar customization */
-    ::-webkit-scrollbar {
-        width: 8px;
-        height: 8px;
-    }
-    
-    ::-webkit-scrollbar-track {
-        background: var(--primary-bg); 
-    }
-    
-    ::-webkit-scrollbar-thumb {
-        background: var(--tertiary-bg); 
-        border-radius: 4px;
-    }
-    
-    ::-webkit-scrollbar-thumb:hover {
-        background: #555; 
-    }
+@st.cache_data(ttl=300, show_spinner=False)
+def _load_documents_cached():
+    return load_documents()
 
-    /* Welcome screen */
-    .welcome-container {
-        text-align: center;
-        padding: 40px 20px;
-    }
-    
-    .welcome-title {
-        font-size: 2.5rem;
-        font-weight: 600;
-        margin-bottom: 10px;
-        color: var(--text-primary);
-    }
-    
-    .welcome-subtitle {
-        font-size: 1.1rem;
-        color: var(--text-secondary);
-    }
+@st.cache_data(ttl=300, show_spinner=False)
+def _load_history_cached(session_id: str):
+    return load_chat_history(session_id)
 
-</style>
-""", unsafe_allow_html=True)
+def _documents():
+    """Uploaded document list, read from storage the first time something needs it"""
+    docs = st.session_state.uploaded_documents
+    if docs is None:
+        docs = st.session_state.uploaded_documents = _load_documents_cached()
+    return docs
 
-# Configuration
-import os
-API_BASE_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+def _latest_trace(messages):
+    """Trace events of the newest message that has any; only scanned when a session is (re)loaded"""
+    for message in reversed(messages):
+        if message.get("trace_events"):
+            return message["trace_events"]
+    return None
 
 # Session state initialization
+sid = st.session_state.setdefault("session_id", f"session_{int(time.time())}")
+# History load stays behind a guard: setdefault would evaluate it on every rerun
 if "messages" not in st.session_state:
-    st.session_state.session_id = f"session_{int(time.time())}"
-    st.session_state.messages = load_chat_history(st.session_state.session_id)
-    
-if "session_id" not in st.session_state:
-    st.session_state.session_id = f"session_{int(time.time())}"
-    
-if "uploaded_documents" not in st.session_state:
-    st.session_state.uploaded_documents = load_documents()
-
-if "user_input" not in st.session_state:
-    st.session_state.user_input = ""
-
-if "current_page" not in st.session_state:
-    st.session_state.current_page = "chat"
+    st.session_state.messages = _load_history_cached(sid)
+    st.session_state.last_trace = _latest_trace(st.session_state.messages)
+# Loaded lazily by _documents()
+st.session_state.setdefault("uploaded_documents", None)
+st.session_state.setdefault("user_input", "")
+st.session_state.setdefault("current_page", "chat")
 
 # ==================== SIDEBAR ====================
 with st.sidebar:
@@ -205,7 +139,9 @@ with st.sidebar:
     if st.button("➕ New Chat", use_container_width=True, key="new_chat"):
         st.session_state.session_id = f"session_{int(time.time())}"
         st.session_state.messages = []
+        st.session_state.last_trace = None
         st.session_state.user_input = ""
+        _cached_session_list.clear()
         st.rerun()
     
     st.divider()
@@ -233,24 +169,30 @@ with st.sidebar:
     
     # Chat history section
     st.subheader("Recent Chats")
-    sessions = get_session_list()
+    sessions = _cached_session_list(limit=10)
     
     if sessions:
+        ids = [session["session_id"] for session in sessions]
+        labels = {session["session_id"]: f"💭 Session ({session['message_count']} msgs)" for session in sessions}
+        current = st.session_state.session_id
+        
+        # One radio instead of a button per session. It defaults to the active session,
+        # so only a real click on another entry registers as a switch.
         with st.container(height=200):
-            for session in sessions[:10]:
-                session_id = session["session_id"]
-                msg_count = session["message_count"]
-                display_name = f"Session ({msg_count} msgs)"
-                
-                if st.button(
-                    f"💭 {display_name}",
-                    use_container_width=True,
-                    key=f"session_{session_id}"
-                ):
-                    st.session_state.session_id = session_id
-                    st.session_state.messages = load_chat_history(session_id)
-                    st.session_state.current_page = "chat"
-                    st.rerun()
+            choice = st.radio(
+                "Recent Chats",
+                ids,
+                index=ids.index(current) if current in ids else None,
+                format_func=labels.get,
+                label_visibility="collapsed"
+            )
+        
+        if choice and choice != current:
+            st.session_state.session_id = choice
+            st.session_state.messages = _load_history_cached(choice)
+            st.session_state.last_trace = _latest_trace(st.session_state.messages)
+            st.session_state.current_page = "chat"
+            st.rerun()
     else:
         st.caption("No chat history available")
     
@@ -276,115 +218,145 @@ with st.sidebar:
     
     # Document management
     st.subheader("Knowledge Base")
-    st.metric("Documents Indexed", len(st.session_state.uploaded_documents))
+    docs = _documents()
+    st.metric("Documents Indexed", len(docs))
     
-    if st.session_state.uploaded_documents:
+    if docs:
         with st.expander("View Document List"):
-            for doc in st.session_state.uploaded_documents:
-                st.caption(f"📄 {doc}")
+            # One element for the whole list instead of one caption per document
+            st.markdown("\n\n".join(f"📄 {doc}" for doc in docs))
     
     if st.button("🗑️ Clear Database", use_container_width=True, type="secondary"):
-        with st.spinner("Clearing knowledge base..."):
-            try:
-                response = requests.delete(
-                    f"{api_url}/clear-knowledge-base/",
-                    timeout=30
-                )
-                if response.status_code == 200:
-                    st.session_state.uploaded_documents = []
-                    st.success("Knowledge base cleared!")
-                    time.sleep(1)
-                    st.rerun()
-                else:
-                    st.error(f"Failed to clear: {response.status_code}")
-            except Exception as e:
-                st.error(f"Connection error: {str(e)}")
+        status_text = st.empty()
+        try:
+            fut = _bg_executor().submit(
+                get_http().delete,
+                f"{api_url}/clear-knowledge-base/",
+                timeout=30
+            )
+            response = _wait_for(fut, status_text, "Clearing knowledge base...")
+            status_text.empty()
+            if response.status_code == 200:
+                st.session_state.uploaded_documents = []
+                clear_all_documents()
+                _load_documents_cached.clear()
+                st.success("Knowledge base cleared!")
+                time.sleep(1)
+                st.rerun()
+            else:
+                st.error(f"Failed to clear: {response.status_code}")
+        except Exception as e:
+            status_text.empty()
+            st.error(f"Connection error: {str(e)}")
 
     st.markdown("---")
     st.caption(f"Session: {st.session_state.session_id[:8]}...")
 
-# ==================== MAIN CONTENT ====================
-if st.session_state.current_page == "chat":
-    # Chat interface container
-    chat_container = st.container()
+# Chat input and send handler. Sending a message reruns only this fragment,
+# not the sidebar, CSS or the history above it.
+@st.fragment
+def _chat_input_fragment(api_url, enable_web_search, rendered_count):
+    # Fragment reruns reuse the arguments of the last full run, so anything past
+    # rendered_count was sent from in here and isn't in the history above yet
+    welcome = st.empty()
+    for message in st.session_state.messages[rendered_count:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+    # The turn being sent is drawn here, above the input box rather than below it
+    live_turn = st.container()
+    
+    # Spacer
+    st.markdown("<div style='height: 50px'></div>", unsafe_allow_html=True)
     
-    with chat_container:
-        if not st.session_state.messages:
-            st.markdown("""
-            <div class="welcome-container">
-                <div class="welcome-title">How can I help you?</div>
-                <div class="welcome-subtitle">Upload PDF documents to context-aware Q&A or ask general questions.</div>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            # Display chat history
-            for message in st.session_state.messages:
-                if message["role"] == "user":
-                    st.markdown(f"""
-                    <div class="user-message">
-                        <div class="user-bubble">{message['content']}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.markdown(f"""
-                    <div class="assistant-message">
-                        <div class="assistant-bubble">{message['content']}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-        
-        # Spacer
-        st.markdown("<div style='height: 50px'></div>", unsafe_allow_html=True)
-        
     # Input area fixed at bottom
     with st.container():
         col1, col2 = st.columns([6, 1])
         with col1:
             user_input = st.chat_input("Type your message here...", key="chat_input")
+    
+    if not st.session_state.messages and not user_input:
+        welcome.markdown("""
+        <div class="welcome-container">
+            <div class="welcome-title">How can I help you?</div>
+            <div class="welcome-subtitle">Upload PDF documents to context-aware Q&A or ask general questions.</div>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    if user_input:
+        # Add user message. One timestamp per turn, shared with the answer.
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        user_message = {
+            "role": "user",
+            "content": user_input,
+            "timestamp": timestamp
+        }
+        st.session_state.messages.append(user_message)
+        append_chat_message(st.session_state.session_id, user_message)
+        _cached_session_list.clear()
+        _load_history_cached.clear()
+        
+        with live_turn:
+            with st.chat_message("user"):
+                st.markdown(user_input)
+        
+            try:
+                if not _backend_up(api_url):
+                    raise requests.exceptions.ConnectionError(f"Backend health check failed at {api_url}")
             
-        if user_input:
-            # Add user message
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            user_message = {
-                "role": "user",
-                "content": user_input,
-                "timestamp": timestamp
-            }
-            st.session_state.messages.append(user_message)
-            save_chat_history(st.session_state.session_id, st.session_state.messages)
-            
-            # Show spinner while waiting for response
-            with st.spinner("Applying RAG & Thinking..."):
-                try:
-                    response = requests.post(
-                        f"{api_url}/chat/",
+                # Show spinner while waiting for the backend to start answering
+                with st.spinner("Applying RAG & Thinking..."):
+                    response = get_http().post(
+                        f"{api_url}/chat/stream",
                         json={
                             "session_id": st.session_state.session_id,
                             "query": user_input,
                             "enable_web_search": enable_web_search
                         },
+                        stream=True,
                         timeout=60
                     )
-                    
+            
+                with response:
                     if response.status_code == 200:
-                        data = response.json()
-                        bot_response = data.get("response", "No response received.")
-                        
-                        assistant_message = {
-                            "role": "assistant",
-                            "content": bot_response,
-                            "timestamp": datetime.now().strftime("%H:%M:%S"),
-                            "trace_events": data.get("trace_events", [])
-                        }
-                        st.session_state.messages.append(assistant_message)
-                        save_chat_history(st.session_state.session_id, st.session_state.messages)
-                        st.rerun()
+                        stream_result = {"trace_events": [], "error": None, "response": None}
+                        with st.chat_message("assistant"):
+                            bot_response = st.write_stream(_iter_tokens(response, stream_result))
+                    
+                        if stream_result["error"]:
+                            st.error(f"API Error: {stream_result['error']}")
+                        else:
+                            # The done event carries the backend's answer; the streamed text is only for display
+                            assistant_message = {
+                                "role": "assistant",
+                                "content": stream_result["response"] or bot_response or "No response received.",
+                                "timestamp": timestamp,
+                                "trace_events": stream_result["trace_events"]
+                            }
+                            st.session_state.messages.append(assistant_message)
+                            st.session_state.last_trace = assistant_message.get("trace_events") or st.session_state.get("last_trace")
+                            append_chat_message(st.session_state.session_id, assistant_message)
+                            _cached_session_list.clear()
+                            _load_history_cached.clear()
                     else:
                         st.error(f"API Error: {response.status_code} - {response.text}")
-                
-                except requests.exceptions.ConnectionError:
-                    st.error("❌ Connection refused. Is the backend server running properly on port 8000?")
-                except Exception as e:
-                    st.error(f"❌ Error occurred: {str(e)}")
+        
+            except requests.exceptions.ConnectionError:
+                st.error("❌ Connection refused. Is the backend server running properly on port 8000?")
+            except Exception as e:
+                st.error(f"❌ Error occurred: {str(e)}")
+
+# ==================== MAIN CONTENT ====================
+if st.session_state.current_page == "chat":
+    # Chat interface container
+    chat_container = st.container()
+    
+    with chat_container:
+        # Display chat history
+        for message in st.session_state.messages:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+    
+    _chat_input_fragment(api_url, enable_web_search, len(st.session_state.messages))
 
 elif st.session_state.current_page == "upload":
     st.title("📤 Document Upload")
@@ -409,16 +381,22 @@ elif st.session_state.current_page == "upload":
             progress_bar.progress(10)
             
             try:
-                files = {"file": (uploaded_file.name, uploaded_file.getvalue(), "application/pdf")}
+                # Stream the multipart body straight from the upload buffer instead of copying it
+                uploaded_file.seek(0)
+                encoder = MultipartEncoder(
+                    fields={"file": (uploaded_file.name, uploaded_file, "application/pdf")}
+                )
                 
-                status_text.text("Uploading file...")
                 progress_bar.progress(30)
                 
-                response = requests.post(
+                fut = _bg_executor().submit(
+                    get_http().post,
                     f"{api_url}/upload-document/",
-                    files=files,
+                    data=encoder,
+                    headers={"Content-Type": encoder.content_type},
                     timeout=120
                 )
+                response = _wait_for(fut, status_text, "Uploading and indexing file...")
                 
                 progress_bar.progress(80)
                 
@@ -428,8 +406,10 @@ elif st.session_state.current_page == "upload":
                     progress_bar.progress(100)
                     
                     if "filename" in data:
-                        st.session_state.uploaded_documents.append(data["filename"])
-                        save_documents(st.session_state.uploaded_documents)
+                        docs = _documents()
+                        docs.append(data["filename"])
+                        save_documents(docs)
+                        _load_documents_cached.clear()
                         st.success(f"✅ Successfully added **{uploaded_file.name}** to knowledge base.")
                         time.sleep(2)
                         st.rerun()
@@ -467,12 +447,8 @@ elif st.session_state.current_page == "trace":
     if not st.session_state.messages:
         st.info("Start a chat to generate trace data.")
     else:
-        last_trace = None
-        # Find last message with trace events
-        for message in reversed(st.session_state.messages):
-            if message.get("trace_events"):
-                last_trace = message.get("trace_events", [])
-                break
+        # Kept up to date whenever an assistant message is added or a session is loaded
+        last_trace = st.session_state.get("last_trace")
         
         if last_trace:
             st.success(f"Found {len(last_trace)} trace events from latest response.")
@@ -481,8 +457,9 @@ elif st.session_state.current_page == "trace":
                 event_type = event.get('event_type', 'generic')
                 node = event.get('node_name', 'unknown')
                 
-                with st.expander(f"Step {i}: {node} ({event_type})"):
+                with st.expander(f"Step {i}: {node} ({event_type})", expanded=False):
                     st.markdown(f"**Description:** {event.get('description')}")
-                    st.json(event)
+                    # Description is already shown above, don't ship it twice
+                    st.json({k: v for k, v in event.items() if k != "description"}, expanded=False)
         else:
             st.warning("No trace data found in recent messages.")
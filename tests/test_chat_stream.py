@@ -0,0 +1,144 @@
+import asyncio
+import importlib
+import sys
+import types
+from pathlib import Path
+from typing import List, TypedDict
+
+import pytest
+from langchain_core.language_models import BaseChatModel, GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.graph import END, StateGraph
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+ANSWER = "Paris is the capital of France."
+
+
+class _State(TypedDict, total=False):
+    messages: List[BaseMessage]
+    last_query: str
+    route: str
+
+
+class _ChunkModel(BaseChatModel):
+    """Streams a fixed list of chunks, tool call chunks included"""
+
+    chunks: List[AIMessageChunk]
+
+    @property
+    def _llm_type(self) -> str:
+        return "chunk-model"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self.chunks[0]
+        for chunk in self.chunks[1:]:
+            message += chunk
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=message.content))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for chunk in self.chunks:
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=generation)
+            yield generation
+
+
+async def _stream(llm, messages) -> AIMessageChunk:
+    message = None
+    async for chunk in llm.astream(messages):
+        message = chunk if message is None else message + chunk
+    return message
+
+
+def _build_graph(combined_chunks=None):
+    """Same shape as agent's graph: an optional combined node, then the answer node.
+    Both stream the LLM and return a fresh AIMessage."""
+    answer_llm = GenericFakeChatModel(messages=iter([AIMessage(content=ANSWER)]))
+
+    async def combined(state: _State) -> _State:
+        response = await _stream(_ChunkModel(chunks=combined_chunks), state["messages"])
+        if response.tool_calls:
+            return {**state, "route": "rag"}
+        return {**state, "route": "end", "messages": state["messages"] + [AIMessage(content=response.content)]}
+
+    async def answer(state: _State) -> _State:
+        response = await _stream(answer_llm, state["messages"])
+        return {**state, "messages": state["messages"] + [AIMessage(content=response.content)]}
+
+    graph = StateGraph(_State)
+    graph.add_node("answer", answer)
+    if combined_chunks is None:
+        graph.set_entry_point("answer")
+    else:
+        graph.add_node("combined", combined)
+        graph.set_entry_point("combined")
+        graph.add_conditional_edges("combined", lambda st: st["route"], {"rag": "answer", "end": END})
+    graph.add_edge("answer", END)
+    return graph.compile()
+
+
+@pytest.fixture
+def main(monkeypatch):
+    # The real agent, Pinecone store and cache need API keys and network; the endpoint only needs their names
+    stubs = {
+        "agent": {"build_agent": None},
+        "vectorstore": {"add_document": None, "clear_index": None},
+        "semantic_cache": {"lookup": lambda *a: None, "store": lambda *a: None, "clear": lambda: None},
+        "persistence": {
+            "save_document_metadata": None, "get_all_documents": None, "delete_document": None,
+            "clear_all_documents": None, "get_session_stats": None,
+        },
+    }
+    for name, attrs in stubs.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.delitem(sys.modules, "main", raising=False)
+    return importlib.import_module("main")
+
+
+def _run(main, graph):
+    main.rag_agent = graph
+    request = main.QueryRequest(session_id="s1", query="What is the capital of France?")
+
+    async def run():
+        return [event async for event in main._run_agent(request)]
+
+    return asyncio.run(run())
+
+
+def _tokens(events):
+    return [value for kind, value in events if kind == "token"]
+
+
+def _done(events):
+    return [value for kind, value in events if kind == "done"]
+
+
+def test_streamed_tokens_match_final_answer(main):
+    events = _run(main, _build_graph())
+
+    assert _done(events) == [ANSWER]
+    assert "".join(_tokens(events)) == ANSWER
+
+
+def test_combined_direct_answer_streams(main):
+    words = ["Paris ", "is the ", "capital of ", "France."]
+    events = _run(main, _build_graph([AIMessageChunk(content=w) for w in words]))
+
+    assert _done(events) == [ANSWER]
+    # Token by token from the combined call, not one piece after the graph finished
+    assert _tokens(events) == words
+
+
+def test_combined_tool_call_is_not_streamed(main):
+    tool_call = AIMessageChunk(
+        content="",
+        tool_call_chunks=[{"name": "retrieve_kb", "args": '{"query": "capital"}', "id": "call_1", "index": 0}],
+    )
+    events = _run(main, _build_graph([tool_call, AIMessageChunk(content="Looking that up")]))
+
+    assert _done(events) == [ANSWER]
+    assert "".join(_tokens(events)) == ANSWER
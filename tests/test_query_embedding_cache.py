@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from query_embedding_cache import cached_embed_query
+
+
+def _recording_embed(calls):
+    def embed(text):
+        calls.append(text)
+        return [float(len(text))]
+    return embed
+
+
+def test_uncased_tokenizer_folds_case_and_whitespace():
+    calls = []
+    embed_query = cached_embed_query(_recording_embed(calls), SimpleNamespace(do_lower_case=True))
+
+    assert embed_query("What is  RAG?") == embed_query("what is rag?")
+    assert calls == ["what is rag?"]
+
+
+def test_cased_tokenizer_keeps_case():
+    calls = []
+    embed_query = cached_embed_query(_recording_embed(calls), SimpleNamespace(do_lower_case=False))
+
+    embed_query("Apple  stock")
+    embed_query("apple stock")
+    embed_query("Apple stock")
+
+    assert calls == ["Apple stock", "apple stock"]